@@ -6,25 +6,13 @@ from subprocess import check_output
 from pathlib import Path
 
 from PySide2 import QtGui
-from PySide2.QtWidgets import QApplication, QMainWindow, QWidget, QFrame, QLabel, QVBoxLayout, QHBoxLayout, QFileDialog, QPushButton, QLineEdit, QRadioButton, QStackedLayout, QCheckBox, QTreeView, QAbstractItemView
-from PySide2.QtCore import Qt, QSize
+from PySide2.QtWidgets import QApplication, QMainWindow, QWidget, QFrame, QLabel, QVBoxLayout, QHBoxLayout, QFileDialog, QPushButton, QLineEdit, QRadioButton, QStackedLayout, QCheckBox, QTreeView, QAbstractItemView, QListWidget
+from PySide2.QtCore import Qt, QSize, QTimer
 from Vobject import Vobject
 from Vtreemodel import VTreeModel
-
-try:
-	sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
-	import FbxCommon
-	from fbx import *
-except ImportError as e:
-	print("Error: module FbxCommon and/or fbx failed to import.\n")
-	print(e)
-	sys.exit(1)
-
-try:
-	import FreeCAD
-except ModuleNotFoundError:
-	print('FreeCAD library not found. Please check the FREECADPATH variable in line 1 is correct')
-	exit()
+from Vconverter import Converter
+from Vtraverse import pre_order
+from Vgeometry import GeometryProcess, converter_settings
 
 class MainWindow(QMainWindow):
 	def __init__(self):
@@ -43,13 +31,16 @@ class MainWindow(QMainWindow):
 		self.linear_deflection = 0.1
 		self.angular_deflection = 0.523599
 
-		self.vertices = []
-		self.previous_indices = 0
-		self.face_indices = []
-		self.face_normals = []
-
-		self.vobjects = []
-		self.alt_vobjects = []
+		self.converter = Converter()
+		self.vobjects = self.converter.vobjects
+		# process holding the FreeCAD document, and the tree nodes in its order
+		self.geometry = None
+		self.geometry_nodes = []
+		# set when the background import failed, the scanned tree then has nothing to export
+		self.geometry_error = None
+		self.geometry_timer = QTimer(self)
+		self.geometry_timer.setInterval(100)
+		self.geometry_timer.timeout.connect(self.poll_geometry)
 
 		self.initUI()
 
@@ -68,6 +59,21 @@ class MainWindow(QMainWindow):
 		self.in_file_label = QLabel(self.in_file)
 		layout.addWidget(self.in_file_label)
 
+		# ### SESSION FILES ###
+
+		session_widget = QWidget()
+		session_layout = QHBoxLayout()
+		session_widget.setLayout(session_layout)
+		layout.addWidget(session_widget)
+
+		open_session_button = QPushButton("Open session")
+		open_session_button.clicked.connect(self.open_session)
+		session_layout.addWidget(open_session_button)
+
+		save_session_button = QPushButton("Save session")
+		save_session_button.clicked.connect(self.save_session)
+		session_layout.addWidget(save_session_button)
+
 		# ### Tesselation type ###
 		# Label
 		tess_type_label = QLabel("Tesselation Type:")
@@ -149,6 +155,40 @@ class MainWindow(QMainWindow):
 		# Add widget to layout
 		angular_deflection_layout.addWidget(self.angular_deflection_box)
 
+		# ### SEARCH ###
+
+		search_widget = QWidget()
+		search_layout = QHBoxLayout()
+		search_widget.setLayout(search_layout)
+		layout.addWidget(search_widget)
+
+		self.search_box = QLineEdit()
+		self.search_box.setPlaceholderText("Search parts")
+		self.search_box.textChanged.connect(self.update_search)
+		search_layout.addWidget(self.search_box)
+
+		self.search_count_label = QLabel("")
+		search_layout.addWidget(self.search_count_label)
+
+		# Bulk tessellation level for every match
+		self.search_level_box = QLineEdit()
+		self.search_level_box.setValidator(QtGui.QDoubleValidator())
+		self.search_level_box.setMaximumWidth(60)
+		search_layout.addWidget(self.search_level_box)
+
+		search_level_button = QPushButton("Set level on matches")
+		search_level_button.clicked.connect(self.set_search_level)
+		search_layout.addWidget(search_level_button)
+
+		self.search_results = QListWidget()
+		self.search_results.setMaximumHeight(120)
+		self.search_results.currentRowChanged.connect(self.show_search_result)
+		self.search_results.hide()
+		layout.addWidget(self.search_results)
+
+		self.search_matches = []
+		self.search_display_limit = 200
+
 		# ### TREE ###
 
 		self.view = QTreeView()
@@ -187,6 +227,33 @@ class MainWindow(QMainWindow):
 		self.center_pivot_box.setChecked(True)
 		output_layout.addWidget(self.center_pivot_box)
 
+		self.validate_meshes_box = QCheckBox("Clean up meshes")
+		self.validate_meshes_box.setChecked(True)
+		output_layout.addWidget(self.validate_meshes_box)
+
+		self.stl_per_part_box = QCheckBox("STL file per part")
+		output_layout.addWidget(self.stl_per_part_box)
+
+		self.selected_only_box = QCheckBox("Tessellate selected only")
+		output_layout.addWidget(self.selected_only_box)
+
+		self.merge_small_parts_box = QCheckBox("Merge small parts")
+		output_layout.addWidget(self.merge_small_parts_box)
+
+		# Shard depth, empty writes a single file
+		output_layout.addWidget(QLabel("Shard depth:"))
+		self.shard_depth_box = QLineEdit()
+		self.shard_depth_box.setValidator(QtGui.QIntValidator(0, 1000))
+		self.shard_depth_box.setMaximumWidth(40)
+		output_layout.addWidget(self.shard_depth_box)
+
+		# extra formats written next to the chosen file from the same tessellation
+		output_layout.addWidget(QLabel("Also save:"))
+		self.extra_format_boxes = {}
+		for out_format in ["FBX", "OBJ", "STL"]:
+			self.extra_format_boxes[out_format] = QCheckBox(out_format)
+			output_layout.addWidget(self.extra_format_boxes[out_format])
+
 
 		save_button = QPushButton("Save")
 		save_button.setMaximumWidth(120)
@@ -206,6 +273,35 @@ class MainWindow(QMainWindow):
 		elif self.mesh_from_shape_rbutton.isChecked():
 			self.switchable_layout.setCurrentIndex(1)
 
+	# ### SEARCH ###
+	def update_search(self, text):
+		self.search_results.clear()
+
+		# only the first matches are listed, the full set is found again when it is needed
+		self.search_matches = self.model.search(text, self.search_display_limit + 1)
+		if not text.strip():
+			self.search_count_label.setText("")
+			self.search_results.hide()
+			return
+
+		count = len(self.search_matches)
+		self.search_count_label.setText(f"{self.search_display_limit}+ matches" if count > self.search_display_limit else f"{count} matches")
+		self.search_matches = self.search_matches[:self.search_display_limit]
+		self.search_results.addItems([self.model.item_path(item) for item in self.search_matches])
+		self.search_results.show()
+
+	def show_search_result(self, row):
+		if row < 0 or row >= len(self.search_matches):
+			return
+		index = self.model.index_for_item(self.search_matches[row])
+		self.view.setCurrentIndex(index)
+		self.view.scrollTo(index)
+
+	def set_search_level(self):
+		if not self.search_box.text().strip() or not self.search_level_box.text():
+			return
+		self.model.set_tess_level(self.model.search(self.search_box.text()), float(self.search_level_box.text()))
+
 	def update_tesselation_value(self):
 		self.tess_amt = float(self.shape_tesselation_amt_box.text())
 		self.linear_deflection = float(self.linear_deflection_box.text())
@@ -218,16 +314,73 @@ class MainWindow(QMainWindow):
 		# check if file selection was cancelled
 		if file_name == "":
 			return
-		
+
 		self.in_file = file_name
 		self.in_file_label.setText(self.in_file)
 
 		self.clear_all()
 		self.load_vobjects()
 
+	# ### SESSION FILES ###
+	def open_session(self):
+		file_name, file_format = QFileDialog.getOpenFileName(self, 'Open session', "./meshes", "VATHSA session(*.vsession);;All Files(*.*) ")
+
+		# check if file selection was cancelled
+		if file_name == "":
+			return
+
+		self.close_geometry()
+		self.geometry_error = None
+		self.converter.open_session(file_name)
+		self.vobjects = self.converter.vobjects
+
+		self.in_file = self.converter.in_file
+		self.in_file_label.setText(f"{self.in_file} (session {file_name})")
+		self.shape_tesselation_amt_box.setText(str(self.converter.tess_amt))
+		self.linear_deflection_box.setText(str(self.converter.linear_deflection))
+		self.angular_deflection_box.setText(str(self.converter.angular_deflection))
+		self.update_tesselation_value()
+		self.center_pivot_box.setChecked(self.converter.center_pivot)
+		if self.converter.method == "single":
+			self.mesh_from_shape_rbutton.setChecked(True)
+		else:
+			self.shape_tesselation_rbutton.setChecked(True)
+		self.update_options_box()
+
+		# restore the names and tessellation levels of every row
+		self.model.setup_model_data2(self.vobjects[0])
+		for vobject, parent, depth in pre_order(self.vobjects):
+			if vobject.model_item != None:
+				vobject.model_item.item_data = [vobject.label, vobject.level]
+		self.model.name_index = None
+		self.view.expandAll()
+
+	def save_session(self):
+		if not self.vobjects:
+			return
+
+		file_name, file_format = QFileDialog.getSaveFileName(self, 'Save session', "./meshes", "VATHSA session(*.vsession);;All Files(*.*) ")
+
+		# check if file selection was cancelled
+		if file_name == "":
+			return
+
+		# make sure the meshes match the current settings before they are stored
+		self.wait_for_geometry()
+		if self.geometry_missing():
+			return
+		if self.geometry != None:
+			self.sync_converter()
+			self.geometry_request("session", file_name)
+			return
+		if self.converter.session == None:
+			self.sync_converter()
+			self.converter.tessellate()
+		self.converter.save_session(file_name)
+
 	# ### GET DESTINATION FILE ###
 	def get_destination_file(self):
-		file_name, file_format = QFileDialog.getSaveFileName(self, 'Export file name/format', "./meshes", "FBX(*.fbx);;OBJ(*.obj);;All Files(*.*) ")
+		file_name, file_format = QFileDialog.getSaveFileName(self, 'Export file name/format', "./meshes", "FBX(*.fbx);;OBJ(*.obj);;STL(*.stl);;All Files(*.*) ")
 
 		# check if file selection was cancelled
 		if file_name == "":
@@ -240,245 +393,152 @@ class MainWindow(QMainWindow):
 
 	# ### OUTPUT FILE ###
 	def save_file(self):
-		self.clear_meshes()
+		self.wait_for_geometry()
+		if self.geometry_missing():
+			return
+		self.sync_converter()
 
-		# choose tesselation method
-		if self.shape_tesselation_rbutton.isChecked():
-			self.shape_tessellate_loaded()
-		elif self.mesh_from_shape_rbutton.isChecked():
-			self.mesh_from_shape()
+		if self.geometry != None:
+			self.geometry_request("save")
+			return
 
-	
-		if self.verbose:
-			for vob in self.vobjects:
-				print(vob.tostring())
+		self.converter.tessellate()
 
 		print(self.model.__repr__)
 
-		# select output file
-		if self.out_format == 'FBX':
-			self.save_fbx()
-		elif self.out_format == 'OBJ':
-			self.save_obj()
-
-	# ### CONVERT TO FBX ###
-	def save_fbx(self):
-		# Prepare the FBX SDK.
-		(lSdkManager, lScene) = FbxCommon.InitializeSdkObjects()
+		self.converter.save()
 
-		# Create the scene.
-		lResult = self.create_scene(lSdkManager, lScene)
+	def sync_converter(self):
+		if self.shape_tesselation_rbutton.isChecked():
+			self.converter.method = "recursive"
+		elif self.mesh_from_shape_rbutton.isChecked():
+			self.converter.method = "single"
+
+		self.converter.in_file = self.in_file
+		self.converter.out_file = self.out_file
+		self.converter.out_format = self.out_format
+		stem = os.path.splitext(self.out_file)[0]
+		self.converter.out_targets = [(out_format, stem + "." + out_format.lower()) for out_format, box in self.extra_format_boxes.items() if box.isChecked()]
+		self.converter.verbose = self.verbose
+		self.converter.center_pivot = self.center_pivot_box.isChecked()
+		self.converter.validate_meshes = self.validate_meshes_box.isChecked()
+		self.converter.stl_per_part = self.stl_per_part_box.isChecked()
+		self.converter.merge_small_parts = self.merge_small_parts_box.isChecked()
+		self.converter.shard_depth = int(self.shard_depth_box.text()) if self.shard_depth_box.text() else None
+		self.converter.tess_amt = self.tess_amt
+		self.converter.linear_deflection = self.linear_deflection
+		self.converter.angular_deflection = self.angular_deflection
+
+		self.converter.selection = []
+		if self.selected_only_box.isChecked():
+			items = [self.model.get_item(index) for index in self.view.selectionModel().selectedIndexes()]
+			chosen = set(id(item) for item in items)
+			for item in items:
+				# rows under a selected ancestor are already covered by it
+				parent = item.parent_item
+				while parent != None and id(parent) not in chosen:
+					parent = parent.parent_item
+				if parent == None and item.vobject != None and item.vobject not in self.converter.selection:
+					self.converter.selection.append(item.vobject)
 
-		if lResult == False:
-			print("\n\nAn error occurred while creating the scene...\n")
-			lSdkManager.Destroy()
+	def load_vobjects(self):
+		self.sync_converter()
+
+		# show the product tree straight from the STEP file and import the geometry in the background
+		try:
+			scanned = self.converter.scan_structure()
+		except Exception as e:
+			print("STEP structure scan failed, loading the whole file instead")
+			print(e)
+			scanned = False
+
+		if scanned:
+			self.vobjects = self.converter.vobjects
+			self.model.setup_model_data2(self.vobjects[0])
+
+			self.in_file_label.setText(self.in_file + " (loading geometry...)")
+			self.geometry = GeometryProcess(self.in_file)
+			self.geometry_timer.start()
 			return
 
-		# Save the scene.
-		lResult = FbxCommon.SaveScene(lSdkManager, lScene, self.out_file)
-
-		if lResult == False:
-			print("\n\nAn error occurred while saving the scene...\n")
-			
-		lSdkManager.Destroy()
-			
-		return
-
-	# ### CONVERT TO OBJ ####
-	def save_obj(self):
-		with open(self.out_file, "w") as f:
-			for vert in self.vertices:
-				f.write(f'v {vert.x} {vert.y} {vert.z}\n')
-			for normal in self.face_normals:
-				f.write(f'vn {normal.x} {normal.y} {normal.z}\n')
-			face_normal_index = 1
-			for face in self.face_indices:
-				f.write(f'f {face[0] + 1}//{face_normal_index} {face[1] + 1}//{face_normal_index} {face[2] + 1}//{face_normal_index}\n')
-				face_normal_index += 1
-
-	def create_scene(self, sdk_manager, scene):
-		lRootNode = scene.GetRootNode()
-
-		for o in self.vobjects:
-			lRootNode.AddChild(self.add_node(sdk_manager, o))
-
-		lGlobalSettings = scene.GetGlobalSettings()
-		
-		return True
-
-	def add_node(self, sdk_manager, vobject):
-		node = self.make_node(sdk_manager, vobject)
-
-		for child in vobject.children:
-			node.AddChild(self.add_node(sdk_manager, child))
-
-		return node
-
-	def make_node(self, sdk_manager, vobject):
-		lMesh = FbxMesh.Create(sdk_manager, vobject.model_item.item_data[0])
-
-		verts = []
-		lMesh.InitControlPoints(len(vobject.vertices))     
-	
-		index = 0
-		for v in vobject.vertices:
-			lMesh.SetControlPointAt(FbxVector4(v.x, v.y, v.z), index)
-			index += 1
-
-		lLayer = lMesh.GetLayer(0)
-		if lLayer == None:
-			lMesh.CreateLayer()
-			lLayer = lMesh.GetLayer(0)
-
-		lLayerElementNormal= FbxLayerElementNormal.Create(lMesh, "normals")
-		lLayerElementNormal.SetMappingMode(FbxLayerElement.EMappingMode.eByPolygonVertex)
-		lLayerElementNormal.SetReferenceMode(FbxLayerElement.EReferenceMode.eIndexToDirect)
-
-		index = 0
-		for f, n in zip(vobject.faces, vobject.normals):
-			lMesh.BeginPolygon(-1, -1, False)
-
-			for i in range(3):
-				lMesh.AddPolygon(f[i])
-
-			lMesh.EndPolygon()
-			lLayerElementNormal.GetDirectArray().Add(FbxVector4(n.x, n.y, n.z))
-			for i in range(3):
-				lLayerElementNormal.GetIndexArray().Add(index)
-			index += 1
-
-
-		lLayer.SetNormals(lLayerElementNormal)
-
-		lNode = FbxNode.Create(sdk_manager, vobject.model_item.item_data[0])
-		lNode.SetNodeAttribute(lMesh)
-		lNode.LclTranslation.Set(FbxDouble3(vobject.position.x, vobject.position.y, vobject.position.z))
-		lNode.SetShadingMode(FbxNode.EShadingMode.eFlatShading)
-
-		return lNode
-
-	def shape_tessellate_loaded(self):
-		for ob in self.vobjects:
-			self.recursive_tessellate_loaded(ob)
-
-	def recursive_tessellate_loaded(self, vobject):
-		for child in vobject.children:
-			self.recursive_tessellate_loaded(child)
-
-
-		if(vobject.part.TypeId == "Part::Feature"):
-			shape = vobject.part.Shape
-			if shape.Faces:
-				# use global values if the vobject tessellation amount is unchanged from 1
-				tess_amt = self.tess_amt if vobject.model_item.item_data[1] == -1 else vobject.model_item.item_data[1]
-				print(vobject.name + " " + str(tess_amt))
-				rawdata = shape.tessellate(tess_amt)
-				vobject.vertices = []
-				vobject.global_verts = []
-				vobject.faces = []
-				vobject.normals = []
-				for v in rawdata[0]:
-					vobject.add_vertex(v)
-					self.vertices.append(v)
-				for f in rawdata[1]:
-					vobject.faces.append(f)
-					self.face_indices.append((f[0]+self.previous_indices, f[1]+self.previous_indices, f[2]+self.previous_indices))
-					v1 = vobject.vertices[f[1]].sub(vobject.vertices[f[0]])
-					v2 = vobject.vertices[f[2]].sub(vobject.vertices[f[0]])
-					normal = v1.cross(v2).normalize()
-					vobject.normals.append(normal)
-					self.face_normals.append(normal)
-				self.previous_indices = self.previous_indices + len(rawdata[1])
-				if self.center_pivot_box.isChecked():
-					vobject.center_pivot()
-
-	def mesh_from_shape(self):
-		import Mesh, Part
-		import MeshPart
-
-		import Import
-		Import.open(self.in_file, "Unnamed")
-		doc = App.ActiveDocument
-
-		__doc__=App.ActiveDocument
-
-		for __object__ in __doc__.RootObjects:
-			vname = __object__.Label.replace(" ", "_")
-			__mesh__=__doc__.addObject("Mesh::Feature", vname)
-			__shape__=Part.getShape(__object__,"")
-			__mesh__.Mesh=MeshPart.meshFromShape(Shape=__shape__, LinearDeflection=self.linear_deflection, AngularDeflection=self.angular_deflection, Relative=False)
-
-			vobject = Vobject(name=vname, position=__object__.Placement.Base)
-
-			# points
-			points = __mesh__.Mesh.Points
-			for point in points:
-				self.vertices.append(point.Vector)
-				vobject.add_vertex(point.Vector)
-			# faces
-			faces = __mesh__.Mesh.Facets
-			for face in faces:
-				self.face_indices.append(face.PointIndices)
-				vobject.faces.append(face.PointIndices)
-				v1 = self.vertices[face.PointIndices[1]].sub(self.vertices[face.PointIndices[0]])
-				v2 = self.vertices[face.PointIndices[2]].sub(self.vertices[face.PointIndices[0]])
-				normal = v1.cross(v2)
-				if normal != FreeCAD.Vector (0.0, 0.0, 0.0):
-					normal = normal.normalize()
-				else:
-					normal = FreeCAD.Vector(1.0, 0.0, 0.0)
-				self.face_normals.append(normal)
-				vobject.normals.append(normal)
-
-			self.vobjects.append(vobject)
-
-		App.closeDocument("Unnamed")
-
-	def load_vobjects(self):
-		# clear any existing objects
-		doc = App.ActiveDocument
-		if doc != None:
-			doc.clearDocument()
+		self.converter.clear_all()
+		self.converter.load_vobjects()
+		self.vobjects = self.converter.vobjects
 
-		# import new file
-		import Import
-		Import.open(self.in_file, "Unnamed")
-		doc = App.ActiveDocument
+		self.model.setup_model_data2(self.vobjects[0])
 
-		objects = doc.RootObjects
+	def poll_geometry(self):
+		if self.geometry == None or self.geometry.poll():
+			self.attach_geometry()
 
-		for ob in objects:
-			self.vobjects.append(self.recursive_load(ob))
+	def wait_for_geometry(self):
+		if self.geometry != None and not self.geometry.finished:
+			self.geometry.wait()
+			self.attach_geometry()
 
-		print(self.vobjects[0].tostring())
+	def attach_geometry(self):
+		self.geometry_timer.stop()
+		self.in_file_label.setText(self.in_file)
+		geometry = self.geometry
+		if geometry == None:
+			return
 
-		self.model.setup_model_data2(self.vobjects[0])
-		
-	def recursive_load(self, node):
-		vname = node.Label.replace(" ", "_")
-		vobject = Vobject(name=vname)
-		vobject.part = node
+		if geometry.error != None:
+			print("Error: geometry import failed")
+			print(geometry.error)
+			self.close_geometry()
+			self.geometry_error = geometry.error
+			self.in_file_label.setText(self.in_file + " (geometry import failed)")
+			return
 
-		if(node.TypeId == "App::Part"):
-			for child in node.Group:
-				vobject.children.append(self.recursive_load(child))
+		matches = self.converter.bind_geometry(geometry.roots)
+		if matches != None:
+			self.geometry_nodes = [matches[id(vobject)] for vobject in geometry.nodes]
+			return
 
-		return vobject
+		# the importer built a different tree, keep the tessellation levels of rows whose path still exists
+		levels = {self.model.item_path(item): item.item_data[1] for item in self.model.get_name_index().items}
+		self.converter.vobjects = geometry.roots
+		self.vobjects = self.converter.vobjects
+		self.geometry_nodes = geometry.nodes
+		self.model.setup_model_data2(self.vobjects[0])
+		for item in self.model.get_name_index().items:
+			item.item_data[1] = levels.get(self.model.item_path(item), -1)
+
+	def geometry_missing(self):
+		# the scanned tree alone would be written as files without any geometry
+		if self.geometry_error != None:
+			print("Error: the geometry of " + self.in_file + " could not be imported, nothing was saved")
+			return True
+		return False
+
+	def geometry_request(self, action, path=None):
+		# the process tessellates with this window's names, levels and selection
+		numbers = {id(vobject): number for number, vobject in enumerate(self.geometry_nodes)}
+		rows = [list(vobject.model_item.item_data[:2]) if vobject.model_item != None else [vobject.name, -1] for vobject in self.geometry_nodes]
+		selection = [numbers[id(vobject)] for vobject in self.converter.selection if id(vobject) in numbers]
+		try:
+			return self.geometry.request(action, converter_settings(self.converter), rows, selection, path)
+		except RuntimeError as e:
+			print("Error: geometry process failed")
+			print(e)
+
+	def close_geometry(self):
+		self.geometry_timer.stop()
+		if self.geometry != None:
+			self.geometry.close()
+		self.geometry = None
+		self.geometry_nodes = []
+
+	def closeEvent(self, event):
+		self.close_geometry()
+		super().closeEvent(event)
 
 	def clear_all(self):
-		self.vertices = []
-		self.previous_indices = 0
-		self.face_indices = []
-		self.face_normals = []
-
-		self.vobjects = []
-		self.alt_vobjects = []
-
-	def clear_meshes(self):
-		self.vertices = []
-		self.previous_indices = 0
-		self.face_indices = []
-		self.face_normals = []
+		self.close_geometry()
+		self.geometry_error = None
+		self.converter.clear_all()
+		self.vobjects = self.converter.vobjects
 
 def main():
 	app = QApplication(sys.argv)
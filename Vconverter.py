@@ -0,0 +1,784 @@
+import os, sys, re, copy, json, time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from Vobject import Vobject
+from Vtraverse import pre_order, post_order, part_children
+
+try:
+	sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+	import FbxCommon
+	from fbx import *
+except ImportError as e:
+	print("Error: module FbxCommon and/or fbx failed to import.\n")
+	print(e)
+	sys.exit(1)
+
+try:
+	import FreeCAD
+except ModuleNotFoundError:
+	print('FreeCAD library not found. Please check the FREECADPATH variable in line 1 is correct')
+	exit()
+
+def coordinates(items):
+	# (x, y, z) rows from FreeCAD vectors, or from the arrays writer processes and merged batches keep instead
+	if hasattr(items, "tolist"):
+		return items.tolist()
+	return [(v.x, v.y, v.z) for v in items]
+
+def vector_array(items):
+	import numpy as np
+
+	if hasattr(items, "dtype"):
+		return items
+	return np.array(coordinates(items), dtype=np.float64).reshape(-1, 3)
+
+# format -> Converter method writing it, each returns the files it wrote
+WRITERS = {"FBX": "save_fbx", "OBJ": "save_obj", "STL": "save_stl"}
+
+# converter attributes the writers read, copied into writer processes
+SNAPSHOT_SETTINGS = ["in_file", "out_file", "stl_per_part", "merge_small_parts", "merge_triangle_limit", "merge_size_limit", "merge_grid_divisions"]
+
+# Headless conversion state and steps, shared by the GUI and the conversion server
+class Converter():
+	def __init__(self):
+		self.in_file = ""
+		self.out_file = ""
+		self.out_format = ""
+		# extra (format, path) outputs written from the same tessellation
+		self.out_targets = []
+
+		# "recursive" or "single"
+		self.method = "recursive"
+		self.center_pivot = True
+		self.validate_meshes = True
+		self.stl_per_part = False
+		self.verbose = False
+
+		# FBX draw call reduction: parts under either limit are merged per grid cell
+		self.merge_small_parts = False
+		self.merge_triangle_limit = 500
+		self.merge_size_limit = 10.0
+		self.merge_grid_divisions = 8
+
+		# split the export into per subtree files at a depth and/or a subtree triangle count, None to disable
+		self.shard_depth = None
+		self.shard_triangle_limit = None
+
+		# several outputs with at least this many triangles in total are written in parallel processes,
+		# each of which pays a FreeCAD and FBX SDK import
+		self.parallel_write_triangles = 100000
+
+		self.tess_amt = 1.0
+		self.linear_deflection = 0.1
+		self.angular_deflection = 0.523599
+		# per part tessellation levels keyed by vobject name, used when no tree model is attached
+		self.tess_overrides = {}
+		# vobjects whose subtrees are tessellated, empty for all
+		self.selection = []
+
+		# optional callable(stage, **info) used to report progress
+		self.progress = None
+
+		self.vertices = []
+		self.previous_indices = 0
+		self.face_indices = []
+		self.face_normals = []
+		self.validation = {}
+
+		self.vobjects = []
+		self.alt_vobjects = []
+
+		# files written by the last save
+		self.outputs = []
+
+		# open Vsession.Session when the meshes came from a session file instead of FreeCAD
+		self.session = None
+
+	def report(self, stage, **info):
+		if self.progress != None:
+			self.progress(stage, **info)
+
+	def node_name(self, vobject):
+		if vobject.model_item != None:
+			return vobject.model_item.item_data[0]
+		return vobject.name
+
+	def tess_level(self, vobject):
+		# use global values if the vobject tessellation amount is unchanged from -1
+		if vobject.model_item != None and vobject.model_item.item_data[1] != -1:
+			return float(vobject.model_item.item_data[1])
+		return float(self.tess_overrides.get(vobject.name, self.tess_amt))
+
+	# ### LOAD, TESSELLATE AND SAVE ###
+	def convert(self):
+		if self.method == "recursive":
+			self.clear_all()
+			self.load_vobjects()
+		self.tessellate()
+		return self.save()
+
+	def tessellate(self):
+		if self.session != None:
+			# already tessellated, the global OBJ arrays are built only if the OBJ writer asks for them
+			return
+
+		self.clear_meshes()
+
+		# choose tesselation method
+		if self.method == "recursive":
+			self.shape_tessellate_loaded()
+		elif self.method == "single":
+			self.mesh_from_shape()
+
+		if any(self.validation.values()):
+			print("Mesh cleanup: " + ", ".join(f"{count} {key}" for key, count in self.validation.items()))
+
+		if self.verbose:
+			for vob in self.vobjects:
+				vob.write_tree(sys.stdout)
+
+	def save(self):
+		self.outputs = []
+		targets = [(self.out_format, self.out_file)]
+		targets += [target for target in self.out_targets if target not in targets]
+		if self.shard_depth != None or self.shard_triangle_limit != None:
+			return self.save_shards(targets)
+		return self.save_targets(targets)
+
+	def save_targets(self, targets):
+		return self.write_targets([(self, out_format, path) for out_format, path in targets])
+
+	def write_targets(self, jobs):
+		# (converter, format, path) jobs, each output reuses its converter's tessellation
+		jobs = [job for job in jobs if job[1] in WRITERS]
+		for converter, out_format, path in jobs:
+			self.report("save", file=path, format=out_format)
+
+		if self.parallel_writes(jobs):
+			# the writers are pure python, so threads would only take turns on the GIL
+			snapshots = {}
+			with ProcessPoolExecutor(max_workers=min(len(jobs), os.cpu_count() or 1)) as pool:
+				futures = []
+				for converter, out_format, path in jobs:
+					if id(converter) not in snapshots:
+						snapshots[id(converter)] = converter.snapshot()
+					futures.append(pool.submit(write_snapshot, snapshots[id(converter)], out_format, path))
+				results = [future.result() for future in futures]
+		else:
+			results = [converter.write(out_format, path) for converter, out_format, path in jobs]
+
+		timings = {}
+		for (converter, out_format, path), (files, seconds) in zip(jobs, results):
+			converter.outputs += files
+			timings[path] = seconds
+			print(f"{out_format} {path} written in {seconds:.3f}s")
+			self.report("saved", file=path, format=out_format, seconds=seconds)
+
+		return timings
+
+	def parallel_writes(self, jobs):
+		# daemonic processes may not start children
+		if len(jobs) < 2 or (os.cpu_count() or 1) < 2 or multiprocessing.current_process().daemon:
+			return False
+		triangles = sum(len(vobject.faces) for converter, out_format, path in jobs for vobject, parent, depth in pre_order(converter.vobjects))
+		return triangles >= self.parallel_write_triangles
+
+	def write(self, out_format, path):
+		start = time.perf_counter()
+		files = getattr(self, WRITERS[out_format])(path)
+		return files, time.perf_counter() - start
+
+	def snapshot(self):
+		# picklable copy of everything the writers read, meshes as numpy arrays
+		import numpy as np
+
+		def indices(faces):
+			return np.array(faces, dtype=np.int64).reshape(-1, 3)
+
+		self.build_global_mesh()
+		numbers = {}
+		nodes = []
+		for vobject, parent, depth in pre_order(self.vobjects):
+			numbers[id(vobject)] = len(nodes)
+			position = (vobject.position.x, vobject.position.y, vobject.position.z)
+			nodes.append((self.node_name(vobject), position, numbers[id(parent)] if parent != None else -1, vector_array(vobject.vertices), indices(vobject.faces), vector_array(vobject.normals)))
+
+		return {
+			"settings": {key: getattr(self, key) for key in SNAPSHOT_SETTINGS},
+			"nodes": nodes,
+			"mesh": (vector_array(self.vertices), indices(self.face_indices), vector_array(self.face_normals)),
+		}
+
+	# ### SHARDED EXPORT ###
+	def save_shards(self, targets):
+		import numpy as np
+
+		shards = self.find_shards()
+		manifest_dir = os.path.dirname(self.out_file)
+		manifest = {"source": self.in_file, "shards": []}
+		jobs = []
+
+		for index, (shard_root, path) in enumerate(shards):
+			shard = self.make_shard(shard_root)
+			label = re.sub(r"[^\w.-]", "_", self.node_name(shard_root))
+			shard_targets = []
+			for out_format, out_file in targets:
+				stem, ext = os.path.splitext(out_file)
+				shard_targets.append((out_format, f"{stem}_{index:03d}_{label}{ext}"))
+
+			entry = {"name": self.node_name(shard_root), "path": path, "triangles": len(shard.face_indices), "vertices": len(shard.vertices), "files": {}}
+			bounds = [vector_array(vobject.vertices) + origin for vobject, origin in shard.world_parts(shard_root)]
+			bounds = np.concatenate(bounds)
+			if len(bounds):
+				entry["bbox"] = {"min": bounds.min(axis=0).tolist(), "max": bounds.max(axis=0).tolist()}
+
+			manifest["shards"].append(entry)
+			jobs.append((shard, shard_targets, entry))
+
+		self.report("shard", shards=len(jobs))
+
+		timings = self.write_targets([(shard, out_format, path) for shard, shard_targets, entry in jobs for out_format, path in shard_targets])
+
+		# list what was written, a target name may have become one file per part
+		for shard, shard_targets, entry in jobs:
+			formats = {os.path.splitext(path)[1].lower(): out_format for out_format, path in shard_targets}
+			for out_file in shard.outputs:
+				out_format = formats[os.path.splitext(out_file)[1].lower()]
+				entry["files"].setdefault(out_format, []).append(os.path.relpath(out_file, manifest_dir))
+			self.outputs += shard.outputs
+
+		manifest_file = os.path.splitext(self.out_file)[0] + "_manifest.json"
+		with open(manifest_file, "w") as f:
+			json.dump(manifest, f, indent=2)
+		print(f"{len(jobs)} shards listed in {manifest_file}")
+		self.outputs.append(manifest_file)
+
+		return timings
+
+	def find_shards(self):
+		# (shard root, tree path) pairs covering every part with geometry
+		triangles = {}
+		for vobject, parent, depth in post_order(self.vobjects):
+			triangles[id(vobject)] = len(vobject.faces) + sum(triangles[id(child)] for child in vobject.children)
+
+		def is_shard_root(vobject, depth):
+			if not vobject.children:
+				return True
+			if self.shard_depth != None and depth >= self.shard_depth:
+				return True
+			return self.shard_triangle_limit != None and triangles[id(vobject)] <= self.shard_triangle_limit
+
+		origins = {}
+		for root in self.vobjects:
+			for vobject, origin in self.world_parts(root):
+				origins[id(vobject)] = origin
+
+		paths = {}
+		shards = []
+		for vobject, parent, depth in pre_order(self.vobjects, descend=lambda vobject, depth: not is_shard_root(vobject, depth)):
+			paths[id(vobject)] = (paths[id(parent)] + "/" if parent != None else "") + self.node_name(vobject)
+			if triangles[id(vobject)] == 0:
+				continue
+
+			# the shard root carries the translation of everything above it
+			shard_root = copy.copy(vobject)
+			shard_root.position = FreeCAD.Vector(origins[id(vobject)])
+			if is_shard_root(vobject, depth):
+				shards.append((shard_root, paths[id(vobject)]))
+			elif vobject.faces:
+				# geometry on a node above the split gets a shard of its own
+				shard_root.children = []
+				shards.append((shard_root, paths[id(vobject)]))
+
+		return shards
+
+	def make_shard(self, shard_root):
+		# converter sharing the settings, with only this subtree's meshes
+		shard = copy.copy(self)
+		shard.vobjects = [shard_root]
+		shard.out_targets = []
+		shard.outputs = []
+		shard.clear_meshes()
+		for vobject, parent, depth in post_order(shard.vobjects):
+			shard.append_global_mesh(vobject)
+		return shard
+
+	# ### CONVERT TO FBX ###
+	def save_fbx(self, path=None):
+		path = path or self.out_file
+
+		# Prepare the FBX SDK.
+		(lSdkManager, lScene) = FbxCommon.InitializeSdkObjects()
+
+		# Create the scene.
+		lResult = self.create_scene(lSdkManager, lScene)
+
+		if lResult == False:
+			print("\n\nAn error occurred while creating the scene...\n")
+			lSdkManager.Destroy()
+			return []
+
+		# Save the scene.
+		lResult = FbxCommon.SaveScene(lSdkManager, lScene, path)
+
+		if lResult == False:
+			print("\n\nAn error occurred while saving the scene...\n")
+
+		lSdkManager.Destroy()
+
+		return [path] if lResult else []
+
+	# ### CONVERT TO OBJ ####
+	def save_obj(self, path=None):
+		path = path or self.out_file
+
+		self.build_global_mesh()
+
+		with open(path, "w") as f:
+			for x, y, z in coordinates(self.vertices):
+				f.write(f'v {x} {y} {z}\n')
+			for x, y, z in coordinates(self.face_normals):
+				f.write(f'vn {x} {y} {z}\n')
+			face_normal_index = 1
+			for face in self.face_indices:
+				f.write(f'f {face[0] + 1}//{face_normal_index} {face[1] + 1}//{face_normal_index} {face[2] + 1}//{face_normal_index}\n')
+				face_normal_index += 1
+
+		return [path]
+
+	# ### CONVERT TO STL ###
+	def save_stl(self, path=None):
+		out_file = path or self.out_file
+		stem, ext = os.path.splitext(out_file)
+
+		# one file per part, or one per root object; a lone root keeps the chosen file name
+		if self.stl_per_part:
+			groups = [[item] for root in self.vobjects for item in self.world_parts(root) if item[0].faces]
+		else:
+			groups = [self.world_parts(root) for root in self.vobjects]
+
+		paths = []
+		for index, group in enumerate(groups):
+			if len(groups) == 1:
+				path = out_file
+			else:
+				# part names repeat and may hold path separators, the index keeps every file distinct
+				label = re.sub(r"[^\w.-]", "_", self.node_name(group[0][0]))
+				path = f"{stem}_{index:03d}_{label}{ext}"
+			self.write_stl(path, group)
+			paths.append(path)
+		return paths
+
+	def world_parts(self, vobject, origin=(0.0, 0.0, 0.0)):
+		# (vobject, world offset) for a subtree, offsets accumulate like the FBX node translations
+		origins = {}
+		parts = []
+		for node, parent, depth in pre_order([vobject]):
+			base = origins[id(parent)] if parent != None else origin
+			origins[id(node)] = (base[0] + node.position.x, base[1] + node.position.y, base[2] + node.position.z)
+			parts.append((node, origins[id(node)]))
+		return parts
+
+	def write_stl(self, path, parts):
+		import numpy as np
+
+		# 50 byte binary STL triangle record
+		stl_record = np.dtype([("normal", "<f4", (3,)), ("vertices", "<f4", (3, 3)), ("attribute", "<u2")])
+
+		count = sum(len(vobject.faces) for vobject, origin in parts)
+		records = np.zeros(count, dtype=stl_record)
+
+		start = 0
+		for vobject, origin in parts:
+			if not vobject.faces:
+				continue
+			end = start + len(vobject.faces)
+			verts = vector_array(vobject.vertices) + origin
+			faces = np.array(vobject.faces, dtype=np.int64).reshape(-1, 3)
+			records["vertices"][start:end] = verts[faces]
+			records["normal"][start:end] = vector_array(vobject.normals)
+			start = end
+
+		header = np.zeros(80, dtype=np.uint8)
+		name = b"VATHSA binary STL"
+		header[:len(name)] = np.frombuffer(name, dtype=np.uint8)
+
+		with open(path, "wb") as f:
+			header.tofile(f)
+			np.array([count], dtype="<u4").tofile(f)
+			records.tofile(f)
+
+	def create_scene(self, sdk_manager, scene):
+		lRootNode = scene.GetRootNode()
+
+		merged = set()
+		if self.merge_small_parts:
+			for lNode in self.make_batch_nodes(sdk_manager, merged):
+				lRootNode.AddChild(lNode)
+
+		self.add_nodes(sdk_manager, lRootNode, merged)
+
+		lGlobalSettings = scene.GetGlobalSettings()
+
+		return True
+
+	def add_nodes(self, sdk_manager, root_node, merged=()):
+		nodes = {}
+		for vobject, parent, depth in pre_order(self.vobjects):
+			if id(vobject) in merged:
+				# geometry lives in a batch node, keep an empty node only if it still has children
+				if not vobject.children:
+					continue
+				node = FbxNode.Create(sdk_manager, self.node_name(vobject))
+				node.LclTranslation.Set(FbxDouble3(vobject.position.x, vobject.position.y, vobject.position.z))
+			else:
+				node = self.make_node(sdk_manager, vobject)
+
+			nodes[id(vobject)] = node
+			parent_node = nodes[id(parent)] if parent != None else root_node
+			parent_node.AddChild(node)
+
+	# ### SMALL PART BATCHING ###
+	def make_batch_nodes(self, sdk_manager, merged):
+		import numpy as np
+
+		# world space bounds of every part small enough to merge
+		small = []
+		for root in self.vobjects:
+			for vobject, origin in self.world_parts(root):
+				if not vobject.faces:
+					continue
+				verts = vector_array(vobject.vertices) + origin
+				low, high = verts.min(axis=0), verts.max(axis=0)
+				if len(vobject.faces) < self.merge_triangle_limit or np.linalg.norm(high - low) < self.merge_size_limit:
+					small.append((vobject, origin, (low + high) / 2))
+
+		if not small:
+			return []
+
+		# uniform grid over the small part centres
+		centres = np.array([centre for vobject, origin, centre in small])
+		grid_min = centres.min(axis=0)
+		cell_size = (centres.max(axis=0) - grid_min) / self.merge_grid_divisions
+		cell_size[cell_size == 0] = 1.0
+		cells = np.minimum(((centres - grid_min) // cell_size).astype(np.int64), self.merge_grid_divisions - 1)
+
+		batches = {}
+		for (vobject, origin, centre), cell in zip(small, map(tuple, cells)):
+			batches.setdefault(cell, []).append((vobject, origin))
+
+		nodes = []
+		for cell, parts in batches.items():
+			batch = Vobject(name="batch_{}_{}_{}".format(*cell))
+			ranges = []
+			vertices = []
+			normals = []
+			first_vertex = 0
+			for vobject, origin in parts:
+				ranges.append([self.node_name(vobject), len(batch.faces), len(vobject.faces)])
+				vertices.append(vector_array(vobject.vertices) + origin)
+				normals.append(vector_array(vobject.normals))
+				batch.faces += [(f[0] + first_vertex, f[1] + first_vertex, f[2] + first_vertex) for f in vobject.faces]
+				first_vertex += len(vobject.vertices)
+				merged.add(id(vobject))
+			batch.vertices = np.concatenate(vertices)
+			batch.normals = np.concatenate(normals)
+
+			lNode = self.make_node(sdk_manager, batch)
+
+			# [part name, first polygon, polygon count] for each merged part
+			lProperty = FbxProperty.Create(lNode, FbxStringDT, "vathsa_parts")
+			lProperty.ModifyFlag(FbxPropertyFlags.EFlags.eUserDefined, True)
+			lProperty.Set(FbxString(json.dumps(ranges)))
+
+			nodes.append(lNode)
+
+		self.report("batch", parts=len(small), batches=len(nodes))
+		return nodes
+
+	def make_node(self, sdk_manager, vobject):
+		lMesh = FbxMesh.Create(sdk_manager, self.node_name(vobject))
+
+		verts = []
+		lMesh.InitControlPoints(len(vobject.vertices))
+
+		index = 0
+		for x, y, z in coordinates(vobject.vertices):
+			lMesh.SetControlPointAt(FbxVector4(x, y, z), index)
+			index += 1
+
+		lLayer = lMesh.GetLayer(0)
+		if lLayer == None:
+			lMesh.CreateLayer()
+			lLayer = lMesh.GetLayer(0)
+
+		lLayerElementNormal= FbxLayerElementNormal.Create(lMesh, "normals")
+		lLayerElementNormal.SetMappingMode(FbxLayerElement.EMappingMode.eByPolygonVertex)
+		lLayerElementNormal.SetReferenceMode(FbxLayerElement.EReferenceMode.eIndexToDirect)
+
+		index = 0
+		for f, n in zip(vobject.faces, coordinates(vobject.normals)):
+			lMesh.BeginPolygon(-1, -1, False)
+
+			for i in range(3):
+				lMesh.AddPolygon(f[i])
+
+			lMesh.EndPolygon()
+			lLayerElementNormal.GetDirectArray().Add(FbxVector4(n[0], n[1], n[2]))
+			for i in range(3):
+				lLayerElementNormal.GetIndexArray().Add(index)
+			index += 1
+
+
+		lLayer.SetNormals(lLayerElementNormal)
+
+		lNode = FbxNode.Create(sdk_manager, self.node_name(vobject))
+		lNode.SetNodeAttribute(lMesh)
+		lNode.LclTranslation.Set(FbxDouble3(vobject.position.x, vobject.position.y, vobject.position.z))
+		lNode.SetShadingMode(FbxNode.EShadingMode.eFlatShading)
+
+		return lNode
+
+	def shape_tessellate_loaded(self):
+		roots = self.vobjects
+		if self.selection:
+			# parts outside the selected subtrees are exported without geometry
+			for ob, parent, depth in pre_order(self.vobjects):
+				ob.vertices, ob.global_verts, ob.faces, ob.normals = [], [], [], []
+			roots = self.selection
+
+		# children before parents, the order the global OBJ indices were always written in
+		for ob, parent, depth in post_order(roots):
+			self.tessellate_loaded(ob)
+
+	def tessellate_loaded(self, vobject):
+		if(vobject.part != None and vobject.part.TypeId == "Part::Feature"):
+			shape = vobject.part.Shape
+			if shape.Faces:
+				tess_amt = self.tess_level(vobject)
+				print(vobject.name + " " + str(tess_amt))
+				self.report("tessellate", part=vobject.name, level=tess_amt)
+				rawdata = shape.tessellate(tess_amt)
+				vobject.vertices = []
+				vobject.global_verts = []
+				vobject.faces = []
+				vobject.normals = []
+				for v in rawdata[0]:
+					vobject.add_vertex(v)
+				vobject.faces = list(rawdata[1])
+
+				self.finish_mesh(vobject)
+				if self.center_pivot and vobject.global_verts:
+					vobject.center_pivot()
+
+	def finish_mesh(self, vobject):
+		# clean up, compute normals and append to the global OBJ arrays
+		if self.validate_meshes:
+			self.validate(vobject)
+		vobject.calc_normals()
+		self.append_global_mesh(vobject)
+
+	def build_global_mesh(self):
+		# sessions only build the global OBJ arrays once a writer asks for them
+		if self.session != None and not self.face_indices:
+			for vobject, parent, depth in post_order(self.vobjects):
+				self.append_global_mesh(vobject)
+
+	def append_global_mesh(self, vobject):
+		offset = self.previous_indices
+		self.vertices += vobject.global_verts
+		self.face_indices += [(f[0] + offset, f[1] + offset, f[2] + offset) for f in vobject.faces]
+		self.face_normals += vobject.normals
+		self.previous_indices += len(vobject.global_verts)
+
+	def validate(self, vobject):
+		from Vvalidate import validate_mesh
+
+		report = validate_mesh(vobject)
+		for key, count in report.items():
+			self.validation[key] = self.validation.get(key, 0) + count
+		if any(report.values()):
+			print(vobject.name + " cleanup " + str(report))
+			self.report("validate", part=vobject.name, **report)
+
+	def mesh_from_shape(self):
+		import Mesh, Part
+		import MeshPart
+
+		import Import
+		Import.open(self.in_file, "Unnamed")
+		doc = FreeCAD.ActiveDocument
+
+		__doc__=FreeCAD.ActiveDocument
+
+		for __object__ in __doc__.RootObjects:
+			vname = __object__.Label.replace(" ", "_")
+			self.report("tessellate", part=vname)
+			__mesh__=__doc__.addObject("Mesh::Feature", vname)
+			__shape__=Part.getShape(__object__,"")
+			__mesh__.Mesh=MeshPart.meshFromShape(Shape=__shape__, LinearDeflection=self.linear_deflection, AngularDeflection=self.angular_deflection, Relative=False)
+
+			vobject = Vobject(name=vname, position=__object__.Placement.Base)
+
+			# points
+			points = __mesh__.Mesh.Points
+			for point in points:
+				vobject.add_vertex(point.Vector)
+			# faces, PointIndices are local to this mesh
+			faces = __mesh__.Mesh.Facets
+			for face in faces:
+				vobject.faces.append(tuple(face.PointIndices))
+
+			self.finish_mesh(vobject)
+			self.vobjects.append(vobject)
+
+		FreeCAD.closeDocument("Unnamed")
+
+	def load_vobjects(self):
+		self.vobjects += self.import_vobjects()
+
+		self.vobjects[0].write_tree(sys.stdout)
+
+	def import_vobjects(self):
+		# clear any existing objects
+		doc = FreeCAD.ActiveDocument
+		if doc != None:
+			doc.clearDocument()
+
+		# import new file
+		self.report("load", file=self.in_file)
+		import Import
+		Import.open(self.in_file, "Unnamed")
+		doc = FreeCAD.ActiveDocument
+
+		objects = doc.RootObjects
+
+		roots = []
+		loaded = {}
+		for node, parent, depth in pre_order(objects, part_children):
+			vname = node.Label.replace(" ", "_")
+			vobject = Vobject(name=vname)
+			vobject.part = node
+			loaded[id(node)] = vobject
+
+			if parent == None:
+				roots.append(vobject)
+			else:
+				loaded[id(parent)].children.append(vobject)
+
+		return roots
+
+	# ### DEFERRED GEOMETRY ###
+	def scan_structure(self):
+		# product tree only, the FreeCAD objects are attached later by bind_geometry
+		from Vstepscan import scan_step
+
+		self.report("scan", file=self.in_file)
+		self.vobjects = scan_step(self.in_file)
+		return len(self.vobjects) > 0
+
+	def bind_geometry(self, loaded):
+		# attach imported objects to the scanned tree, returns {id(imported): scanned}, or None if the trees differ and loaded must replace it
+		def suffixed(scanned, imported):
+			# FreeCAD makes repeated labels unique with a three digit suffix, Part -> Part001
+			return re.fullmatch(re.escape(scanned.name) + r"\d{3}", imported.name) != None
+
+		pairs = []
+		stack = [(self.vobjects, loaded)]
+		while stack:
+			scanned_children, loaded_children = stack.pop()
+			if len(scanned_children) != len(loaded_children):
+				return None
+			names = set(scanned.name for scanned in scanned_children)
+			unused = list(loaded_children)
+			for scanned in scanned_children:
+				match = next((imported for imported in unused if imported.name == scanned.name), None)
+				if match == None:
+					# a suffixed name that is itself a scanned sibling belongs to that sibling
+					match = next((imported for imported in unused if imported.name not in names and suffixed(scanned, imported)), None)
+				if match == None:
+					return None
+				unused.remove(match)
+				pairs.append((scanned, match))
+				stack.append((scanned.children, match.children))
+
+		# geometry is placed globally, the scanned translations were only for display
+		for scanned, imported in pairs:
+			scanned.part = imported.part
+			scanned.position = imported.position
+		return {id(imported): scanned for scanned, imported in pairs}
+
+	# ### SESSION FILES ###
+	def save_session(self, path):
+		from Vsession import write_session
+
+		write_session(self, path)
+		self.report("session", file=path)
+
+	def open_session(self, path):
+		from Vsession import Session
+
+		self.clear_all()
+		self.session = Session(path)
+		self.vobjects = self.session.load_vobjects()
+
+		settings = self.session.header["settings"]
+		self.in_file = self.session.header["in_file"]
+		self.method = settings["method"]
+		self.tess_amt = settings["tess_amt"]
+		self.linear_deflection = settings["linear_deflection"]
+		self.angular_deflection = settings["angular_deflection"]
+		self.center_pivot = settings["center_pivot"]
+
+	def clear_all(self):
+		if self.session != None:
+			self.session.close()
+			self.session = None
+
+		self.vertices = []
+		self.previous_indices = 0
+		self.face_indices = []
+		self.face_normals = []
+		self.validation = {}
+
+		self.vobjects = []
+		self.alt_vobjects = []
+
+	def clear_meshes(self):
+		self.vertices = []
+		self.previous_indices = 0
+		self.face_indices = []
+		self.face_normals = []
+		self.validation = {}
+
+# ### WRITER PROCESSES ###
+def load_snapshot(snapshot):
+	converter = Converter()
+	for key, value in snapshot["settings"].items():
+		setattr(converter, key, value)
+
+	# meshes stay numpy arrays, the writers take those as well as FreeCAD vectors
+	nodes = []
+	for name, position, parent, vertices, faces, normals in snapshot["nodes"]:
+		vobject = Vobject(name=name, position=position)
+		vobject.vertices = vertices
+		vobject.faces = faces.tolist()
+		vobject.normals = normals
+		if parent == -1:
+			converter.vobjects.append(vobject)
+		else:
+			nodes[parent].children.append(vobject)
+		nodes.append(vobject)
+
+	vertices, faces, normals = snapshot["mesh"]
+	converter.vertices = vertices
+	converter.face_indices = faces.tolist()
+	converter.face_normals = normals
+	return converter
+
+def write_snapshot(snapshot, out_format, path):
+	# timed from the start so rebuilding the meshes counts towards the writer
+	start = time.perf_counter()
+	files, seconds = load_snapshot(snapshot).write(out_format, path)
+	return files, time.perf_counter() - start
@@ -0,0 +1,145 @@
+# FreeCAD geometry for the GUI, imported and tessellated in a child process
+# Import.open is one long C++ call that holds the GIL, and FreeCAD is not thread safe, so the
+# window never touches the document itself. It sends the row names, levels and selection to
+# the process, which tessellates and writes the outputs.
+
+import traceback
+import multiprocessing
+
+from Vobject import Vobject
+from Vtraverse import pre_order
+
+# converter attributes copied to the process for every request
+SETTINGS = [
+	"method", "out_file", "out_format", "out_targets", "verbose",
+	"center_pivot", "validate_meshes", "stl_per_part", "merge_small_parts", "shard_depth",
+	"tess_amt", "linear_deflection", "angular_deflection",
+]
+
+def converter_settings(converter):
+	return {key: getattr(converter, key) for key in SETTINGS}
+
+def geometry_worker(in_file, connection):
+	try:
+		import FreeCAD
+		from Vconverter import Converter
+		from Vtreeitem import VTreeItem
+
+		converter = Converter()
+		converter.in_file = in_file
+		roots = converter.import_vobjects()
+	except Exception:
+		connection.send(("error", traceback.format_exc()))
+		return
+
+	# the tree goes back as (name, parent number) pairs in pre-order
+	nodes = []
+	numbers = {}
+	tree = []
+	for vobject, parent, depth in pre_order(roots):
+		numbers[id(vobject)] = len(nodes)
+		nodes.append(vobject)
+		tree.append((vobject.name, numbers[id(parent)] if parent != None else -1))
+	connection.send(("loaded", tree))
+
+	# rows mirroring the window's, so node_name and tess_level see the names and levels set there
+	for root in roots:
+		VTreeItem(obj=root)
+
+	while True:
+		try:
+			request = connection.recv()
+		except EOFError:
+			break
+		if request == None:
+			break
+
+		action, settings, rows, selection, path = request
+		try:
+			for key, value in settings.items():
+				setattr(converter, key, value)
+			for vobject, row in zip(nodes, rows):
+				vobject.model_item.item_data = list(row)
+			converter.vobjects = list(roots)
+			converter.selection = [nodes[number] for number in selection]
+
+			converter.tessellate()
+			if action == "session":
+				converter.save_session(path)
+				connection.send(("done", path))
+			else:
+				connection.send(("done", converter.save()))
+		except Exception:
+			connection.send(("error", traceback.format_exc()))
+
+	for name in list(FreeCAD.listDocuments()):
+		FreeCAD.closeDocument(name)
+
+# Handle to the process owning one STEP file's FreeCAD document
+class GeometryProcess:
+	def __init__(self, in_file):
+		self.connection, child = multiprocessing.Pipe()
+		# not daemonic so it can write several outputs in parallel processes, the window closes it on exit
+		self.process = multiprocessing.Process(target=geometry_worker, args=(in_file, child))
+		self.process.start()
+		child.close()
+
+		# filled in once the import has finished
+		self.finished = False
+		self.roots = []
+		self.nodes = []
+		self.error = None
+
+	def poll(self):
+		# True once the import has finished or failed, never blocks
+		if not self.finished and self.connection.poll():
+			self.receive_tree()
+		return self.finished
+
+	def wait(self):
+		if not self.finished:
+			self.receive_tree()
+
+	def receive_tree(self):
+		self.finished = True
+		try:
+			kind, value = self.connection.recv()
+		except EOFError:
+			kind, value = "error", self.exit_message()
+
+		if kind == "error":
+			self.error = value
+			return
+
+		for name, parent in value:
+			vobject = Vobject(name=name)
+			if parent == -1:
+				self.roots.append(vobject)
+			else:
+				self.nodes[parent].children.append(vobject)
+			self.nodes.append(vobject)
+
+	def request(self, action, settings, rows, selection, path=None):
+		# blocks until the process has written the outputs, raises RuntimeError on failure
+		try:
+			self.connection.send((action, settings, rows, selection, path))
+			kind, value = self.connection.recv()
+		except (EOFError, OSError):
+			raise RuntimeError(self.exit_message())
+		if kind == "error":
+			raise RuntimeError(value)
+		return value
+
+	def exit_message(self):
+		self.process.join(1)
+		return f"geometry process exited with code {self.process.exitcode}"
+
+	def close(self):
+		try:
+			self.connection.send(None)
+		except OSError:
+			pass
+		self.process.join(1)
+		if self.process.is_alive():
+			self.process.terminate()
+		self.connection.close()
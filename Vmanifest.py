@@ -0,0 +1,84 @@
+# Incremental build manifest for batch conversions
+# Records what every output was built from, so unchanged jobs can be skipped on the next run.
+
+import os, json, hashlib
+
+MANIFEST_NAME = "vathsa_manifest.json"
+
+# job fields that do not change the output
+IGNORED_KEYS = ["id", "in_file", "out_file"]
+
+# modules whose code decides what gets written
+SOURCES = ["Vconverter.py", "Vobject.py", "Vvalidate.py", "Vtraverse.py"]
+
+def file_hash(path):
+	digest = hashlib.sha256()
+	with open(path, "rb") as f:
+		for block in iter(lambda: f.read(1 << 20), b""):
+			digest.update(block)
+	return digest.hexdigest()
+
+def source_version():
+	# hash of the modules that shape the outputs, so any change to the conversion invalidates old builds
+	digest = hashlib.sha256()
+	for name in SOURCES:
+		digest.update(file_hash(os.path.join(os.path.dirname(os.path.realpath(__file__)), name)).encode())
+	return digest.hexdigest()[:16]
+
+VERSION = source_version()
+
+class BuildManifest:
+	def __init__(self, path):
+		self.path = path
+		self.entries = {}
+		# input file states seen during this run
+		self.states = {}
+		if os.path.exists(path):
+			with open(path) as f:
+				self.entries = json.load(f).get("outputs", {})
+
+	def settings(self, job):
+		return {key: value for key, value in job.items() if key not in IGNORED_KEYS}
+
+	def input_state(self, job, entry=None):
+		if job["in_file"] in self.states:
+			return self.states[job["in_file"]]
+
+		stat = os.stat(job["in_file"])
+		state = {"size": stat.st_size, "mtime": stat.st_mtime}
+
+		# only hash when the cheap checks disagree with what was recorded
+		if entry != None and entry.get("size") == state["size"] and entry.get("mtime") == state["mtime"]:
+			state["sha256"] = entry["sha256"]
+		else:
+			state["sha256"] = file_hash(job["in_file"])
+		self.states[job["in_file"]] = state
+		return state
+
+	def up_to_date(self, job):
+		entry = self.entries.get(job["out_file"])
+		if entry == None:
+			return False
+		if entry["version"] != VERSION or entry["input"] != job["in_file"]:
+			return False
+		if json.loads(json.dumps(self.settings(job))) != entry["settings"]:
+			return False
+		if not all(os.path.exists(output) for output in entry["outputs"]):
+			return False
+
+		state = self.input_state(job, entry)
+		if state["sha256"] != entry["sha256"]:
+			return False
+
+		# touched but unchanged, remember the new mtime so the hash is skipped next time
+		entry.update(state)
+		return True
+
+	def record(self, job, state, outputs):
+		self.entries[job["out_file"]] = dict(state, input=job["in_file"], version=VERSION, settings=self.settings(job), outputs=outputs)
+
+	def save(self):
+		temp_path = self.path + ".tmp"
+		with open(temp_path, "w") as f:
+			json.dump({"version": VERSION, "outputs": self.entries}, f, indent=2)
+		os.replace(temp_path, self.path)
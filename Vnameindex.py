@@ -0,0 +1,58 @@
+import bisect
+
+from Vtraverse import pre_order
+
+def item_children(item):
+	return item.child_items
+
+# Name search over the tree items, built once per loaded file
+# All names are joined into one lowercase string so a substring search is a few str.find calls instead of a tree walk.
+class NameIndex:
+	def __init__(self, root_item):
+		self.items = []
+		self.offsets = []
+		self.rows = {}
+
+		names = []
+		position = 0
+		for row, item in enumerate(root_item.child_items):
+			self.rows[id(item)] = row
+		for item, parent, depth in pre_order(root_item.child_items, item_children, root_item):
+			for row, child in enumerate(item.child_items):
+				self.rows[id(child)] = row
+
+			name = str(item.item_data[0]).lower()
+			self.items.append(item)
+			self.offsets.append(position)
+			names.append(name)
+			position += len(name) + 1
+
+		self.text = "\n".join(names)
+
+	def search(self, text, limit=None):
+		text = text.strip().lower()
+		if not text or "\n" in text:
+			return []
+
+		matches = []
+		start = self.text.find(text)
+		while start != -1:
+			index = bisect.bisect_right(self.offsets, start) - 1
+			matches.append(self.items[index])
+			if limit != None and len(matches) >= limit:
+				break
+			# one hit per name, continue with the next one
+			if index + 1 == len(self.offsets):
+				break
+			start = self.text.find(text, self.offsets[index + 1])
+		return matches
+
+	def row(self, item):
+		return self.rows.get(id(item), 0)
+
+	def path(self, item):
+		names = []
+		while item != None and item.parent_item != None:
+			names.append(str(item.item_data[0]))
+			item = item.parent_item
+		return "/".join(reversed(names))
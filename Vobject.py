@@ -1,3 +1,7 @@
+import io
+
+from Vtraverse import pre_order
+
 class Vobject():
     def __init__(self, name="", position=(0,0,0)):
         self.name = name
@@ -14,24 +18,21 @@ class Vobject():
         self.max_face_ind = 0
 
     def tostring(self):
-        return self.recursive_to_string(0)
-
-    def recursive_to_string(self, level):
-        string = ""
-        for i in range(level):
-            string += "   "
-
-        self.calc_min_max()
-        string += self.name
-        if len(self.vertices) > 1:
-            string += " v:" + str(self.vertices[0])
-
-        for child in self.children:
-            string += "\n" + child.recursive_to_string(level + 1)
+        out = io.StringIO()
+        self.write_tree(out)
+        return out.getvalue().rstrip("\n")
 
-        return string
+    def write_tree(self, f):
+        # streams one line per node, so dumping a large assembly never builds the whole string
+        for vobject, parent, level in pre_order([self]):
+            line = "   " * level + vobject.name
+            if len(vobject.vertices) > 1:
+                line += " v:" + str(vobject.vertices[0])
+            f.write(line + "\n")
 
     def calc_min_max(self):
+        self.min_face_ind = 1
+        self.max_face_ind = 0
         for face in self.faces:
             for i in range(3):
                 if face[i] < self.min_face_ind:
@@ -44,6 +45,19 @@ class Vobject():
         self.global_verts.append(v)
         self.vertices.append(vtx)
 
+    def calc_normals(self):
+        import FreeCAD
+        self.normals = []
+        for f in self.faces:
+            v1 = self.vertices[f[1]].sub(self.vertices[f[0]])
+            v2 = self.vertices[f[2]].sub(self.vertices[f[0]])
+            normal = v1.cross(v2)
+            if normal != FreeCAD.Vector(0.0, 0.0, 0.0):
+                normal = normal.normalize()
+            else:
+                normal = FreeCAD.Vector(1.0, 0.0, 0.0)
+            self.normals.append(normal)
+
     def center_pivot(self):
         self.position *= 0
         for v in self.global_verts:
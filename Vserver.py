@@ -0,0 +1,305 @@
+# Long running conversion server for VATHSA
+# Keeps FreeCAD loaded in a bounded pool of worker processes so batch jobs skip the interpreter and FreeCAD startup.
+#
+#   serve:   <FreeCAD python> Vserver.py serve --workers 4
+#   submit:  python Vserver.py submit step_files/cube.step step_files/sphere.step --format OBJ
+#
+# Jobs are sent as one JSON object per line, progress comes back the same way.
+
+import os, sys
+import argparse, json, socket, socketserver, time, traceback
+import multiprocessing, multiprocessing.pool
+from queue import Empty
+
+from Vmanifest import BuildManifest, MANIFEST_NAME
+
+HOST = "127.0.0.1"
+PORT = 50515
+# how often a waiting handler checks that the workers running its jobs are still alive
+POLL_SECONDS = 5
+
+FORMAT_EXTENSIONS = {"FBX": ".fbx", "OBJ": ".obj", "STL": ".stl"}
+STEP_EXTENSIONS = (".step", ".stp")
+
+# ### WORKER PROCESS ###
+# why this worker could not load FreeCAD or the FBX SDK, reported by every job it takes
+worker_error = None
+
+def init_worker():
+	global worker_error
+
+	# pay the FreeCAD import once per worker instead of once per job
+	try:
+		import FreeCAD
+		import Import, Part, Mesh, MeshPart
+		import Vconverter
+	except BaseException as e:
+		# Vconverter exits when fbx is missing, a dying initializer would only make the pool start another worker
+		worker_error = f"worker could not import FreeCAD or the FBX SDK: {e!r}"
+
+def run_job(job, queue):
+	job_id = job.get("id")
+	start = time.perf_counter()
+	# lets the server notice a worker that dies inside FreeCAD
+	queue.put({"id": job_id, "stage": "start", "pid": os.getpid()})
+
+	try:
+		if worker_error != None:
+			raise RuntimeError(worker_error)
+
+		from Vconverter import Converter
+
+		converter = Converter()
+		converter.progress = lambda stage, **info: queue.put(dict(info, id=job_id, stage=stage))
+
+		converter.in_file = job["in_file"]
+		converter.out_file = job["out_file"]
+		converter.out_format = job.get("out_format", "FBX")
+		converter.out_targets = [tuple(target) for target in job.get("out_targets", [])]
+		converter.method = job.get("method", "recursive")
+		converter.center_pivot = job.get("center_pivot", True)
+		converter.validate_meshes = job.get("validate_meshes", True)
+		converter.stl_per_part = job.get("stl_per_part", False)
+		converter.merge_small_parts = job.get("merge_small_parts", False)
+		converter.merge_triangle_limit = job.get("merge_triangle_limit", converter.merge_triangle_limit)
+		converter.merge_size_limit = job.get("merge_size_limit", converter.merge_size_limit)
+		converter.merge_grid_divisions = job.get("merge_grid_divisions", converter.merge_grid_divisions)
+		converter.shard_depth = job.get("shard_depth")
+		converter.shard_triangle_limit = job.get("shard_triangle_limit")
+		converter.tess_amt = job.get("tess_amt", converter.tess_amt)
+		converter.linear_deflection = job.get("linear_deflection", converter.linear_deflection)
+		converter.angular_deflection = job.get("angular_deflection", converter.angular_deflection)
+		converter.tess_overrides = job.get("tess_overrides", {})
+
+		timings = converter.convert()
+		queue.put({"id": job_id, "stage": "done", "out_file": converter.out_file, "writers": timings, "outputs": converter.outputs, "seconds": time.perf_counter() - start})
+	except Exception as e:
+		queue.put({"id": job_id, "stage": "error", "error": repr(e), "traceback": traceback.format_exc()})
+	finally:
+		if worker_error == None:
+			close_documents()
+
+def close_documents():
+	# documents would otherwise pile up in the long lived worker
+	import FreeCAD
+
+	for name in list(FreeCAD.listDocuments()):
+		FreeCAD.closeDocument(name)
+
+# ### SERVER ###
+class WorkerProcess(multiprocessing.Process):
+	# Pool makes its workers daemonic, but a worker writes several large outputs in processes of its own
+	@property
+	def daemon(self):
+		return False
+
+	@daemon.setter
+	def daemon(self, value):
+		pass
+
+class WorkerContext(type(multiprocessing.get_context())):
+	Process = WorkerProcess
+
+class JobHandler(socketserver.StreamRequestHandler):
+	def handle(self):
+		queue = self.server.manager.Queue()
+		# job id -> worker pid, for jobs that have started and not finished
+		running = {}
+		waiting = set()
+
+		# read jobs until a blank line or the client closes its side
+		for line in self.rfile:
+			line = line.strip()
+			if not line:
+				break
+			try:
+				job = json.loads(line)
+				job.setdefault("id", len(waiting))
+			except (ValueError, AttributeError) as e:
+				self.send({"id": None, "stage": "error", "error": repr(e)})
+				continue
+			error = lambda e, job_id=job["id"]: queue.put({"id": job_id, "stage": "error", "error": repr(e)})
+			self.server.pool.apply_async(run_job, (job, queue), error_callback=error)
+			self.send({"id": job["id"], "stage": "queued"})
+			waiting.add(job["id"])
+
+		while waiting:
+			try:
+				message = queue.get(timeout=POLL_SECONDS)
+			except Empty:
+				# a worker killed by a crash in FreeCAD never reports back, the pool just replaces it
+				alive = {process.pid for process in multiprocessing.active_children()}
+				for job_id, pid in list(running.items()):
+					if pid not in alive:
+						del running[job_id]
+						queue.put({"id": job_id, "stage": "error", "error": f"worker {pid} exited during the job"})
+				continue
+
+			if message["id"] not in waiting:
+				continue
+			if message["stage"] == "start":
+				running[message["id"]] = message["pid"]
+			self.send(message)
+			if message["stage"] in ("done", "error"):
+				running.pop(message["id"], None)
+				waiting.discard(message["id"])
+
+	def send(self, message):
+		self.wfile.write((json.dumps(message) + "\n").encode())
+		self.wfile.flush()
+
+class ConversionServer(socketserver.ThreadingTCPServer):
+	allow_reuse_address = True
+	daemon_threads = True
+
+	def __init__(self, address, workers):
+		super().__init__(address, JobHandler)
+		self.manager = multiprocessing.Manager()
+		self.pool = multiprocessing.pool.Pool(workers, initializer=init_worker, context=WorkerContext())
+
+	def server_close(self):
+		super().server_close()
+		self.pool.terminate()
+		self.manager.shutdown()
+
+def serve(host, port, workers):
+	try:
+		import FreeCAD
+	except ModuleNotFoundError:
+		print('FreeCAD library not found. Start the server with the python that ships with FreeCAD')
+		sys.exit(1)
+
+	# exits here, before any worker starts, when the FBX SDK is missing
+	import Vconverter
+
+	with ConversionServer((host, port), workers) as server:
+		print(f"VATHSA conversion server on {host}:{port} with {workers} workers")
+		try:
+			server.serve_forever()
+		except KeyboardInterrupt:
+			pass
+
+# ### CLIENT ###
+def submit(jobs, host=HOST, port=PORT):
+	# yields progress messages as the server streams them back
+	with socket.create_connection((host, port)) as sock:
+		for job in jobs:
+			sock.sendall((json.dumps(job) + "\n").encode())
+		sock.shutdown(socket.SHUT_WR)
+
+		with sock.makefile("r") as f:
+			for line in f:
+				yield json.loads(line)
+
+def input_files(paths):
+	# folders are expanded to the STEP files they contain
+	files = []
+	for path in paths:
+		if os.path.isdir(path):
+			files += sorted(os.path.join(path, name) for name in os.listdir(path) if name.lower().endswith(STEP_EXTENSIONS))
+		else:
+			files.append(path)
+	return files
+
+def make_jobs(args):
+	os.makedirs(args.out_dir, exist_ok=True)
+
+	overrides = {}
+	if args.overrides:
+		with open(args.overrides) as f:
+			overrides = json.load(f)
+
+	jobs = []
+	for index, in_file in enumerate(input_files(args.files)):
+		stem = os.path.abspath(os.path.join(args.out_dir, os.path.splitext(os.path.basename(in_file))[0]))
+		jobs.append({
+			"id": index,
+			"in_file": os.path.abspath(in_file),
+			"out_file": stem + FORMAT_EXTENSIONS[args.format[0]],
+			"out_format": args.format[0],
+			"out_targets": [(out_format, stem + FORMAT_EXTENSIONS[out_format]) for out_format in args.format[1:]],
+			"method": args.method,
+			"center_pivot": not args.no_center_pivot,
+			"validate_meshes": not args.no_validate,
+			"stl_per_part": args.stl_per_part,
+			"merge_small_parts": args.merge_small_parts,
+			"merge_triangle_limit": args.merge_triangles,
+			"merge_size_limit": args.merge_size,
+			"merge_grid_divisions": args.merge_grid,
+			"shard_depth": args.shard_depth,
+			"shard_triangle_limit": args.shard_triangles,
+			"tess_amt": args.tess,
+			"linear_deflection": args.linear,
+			"angular_deflection": args.angular,
+			"tess_overrides": overrides,
+		})
+	return jobs
+
+def main():
+	parser = argparse.ArgumentParser(description="VATHSA conversion server")
+	parser.add_argument("--host", default=HOST)
+	parser.add_argument("--port", type=int, default=PORT)
+	commands = parser.add_subparsers(dest="command", required=True)
+
+	serve_parser = commands.add_parser("serve", help="run the server, needs FreeCAD's python")
+	serve_parser.add_argument("--workers", type=int, default=max(1, os.cpu_count() // 2))
+
+	submit_parser = commands.add_parser("submit", help="send STEP files to a running server")
+	submit_parser.add_argument("files", nargs="+", help="STEP files or folders of them")
+	submit_parser.add_argument("--out-dir", default="./meshes")
+	submit_parser.add_argument("--format", nargs="+", default=["FBX"], choices=sorted(FORMAT_EXTENSIONS), help="one or more formats, all written from one tessellation")
+	submit_parser.add_argument("--method", default="recursive", choices=["recursive", "single"])
+	submit_parser.add_argument("--tess", type=float, default=1.0)
+	submit_parser.add_argument("--linear", type=float, default=0.1)
+	submit_parser.add_argument("--angular", type=float, default=0.523599)
+	submit_parser.add_argument("--no-center-pivot", action="store_true")
+	submit_parser.add_argument("--no-validate", action="store_true", help="skip the mesh cleanup pass")
+	submit_parser.add_argument("--stl-per-part", action="store_true")
+	submit_parser.add_argument("--merge-small-parts", action="store_true")
+	submit_parser.add_argument("--merge-triangles", type=int, default=500, help="parts with fewer triangles than this are merged")
+	submit_parser.add_argument("--merge-size", type=float, default=10.0, help="parts with a smaller bounding box diagonal than this are merged")
+	submit_parser.add_argument("--merge-grid", type=int, default=8, help="grid cells per axis that merged parts are grouped by")
+	submit_parser.add_argument("--shard-depth", type=int, help="write one file per subtree at this depth, plus a JSON manifest")
+	submit_parser.add_argument("--shard-triangles", type=int, help="write one file per subtree with at most this many triangles")
+	submit_parser.add_argument("--overrides", help="JSON file of part name to tessellation level")
+	submit_parser.add_argument("--force", action="store_true", help="rebuild outputs the manifest says are up to date")
+
+	args = parser.parse_args()
+
+	if args.command == "serve":
+		serve(args.host, args.port, args.workers)
+		return
+
+	# skip outputs whose input and settings are unchanged since they were built
+	manifest = BuildManifest(os.path.join(args.out_dir, MANIFEST_NAME))
+	jobs = []
+	for job in make_jobs(args):
+		if not args.force and manifest.up_to_date(job):
+			print(f"[{job['id']}] up to date {job['out_file']}")
+		else:
+			jobs.append(job)
+	manifest.save()
+
+	if not jobs:
+		return
+
+	# largest inputs first so the long jobs do not start last
+	jobs.sort(key=lambda job: os.path.getsize(job["in_file"]), reverse=True)
+	pending = {job["id"]: (job, manifest.input_state(job)) for job in jobs}
+
+	failed = 0
+	for message in submit(jobs, args.host, args.port):
+		stage = message.pop("stage")
+		job_id = message.pop("id")
+		print(f"[{job_id}] {stage} {' '.join(f'{k}={v}' for k, v in message.items() if k not in ('traceback', 'outputs'))}")
+		if stage == "done":
+			job, state = pending[job_id]
+			manifest.record(job, state, message.get("outputs", []))
+			manifest.save()
+		elif stage == "error":
+			failed += 1
+			print(message.get("traceback", ""))
+	sys.exit(1 if failed else 0)
+
+if __name__=='__main__':
+	main()
@@ -0,0 +1,152 @@
+# Tessellated session snapshot
+#
+# Layout: 8 byte magic, little endian uint64 header length, JSON header, then the
+# mesh arrays, each starting on a 64 byte boundary so they can be viewed straight
+# out of an mmap. Array offsets in the header are relative to the start of the data.
+
+import json, mmap, struct
+
+import numpy as np
+
+from Vobject import Vobject
+from Vtraverse import pre_order
+
+MAGIC = b"VATHSA1\0"
+ALIGN = 64
+
+# name -> dtype, every array is (count, 3)
+ARRAYS = {"global_verts": "<f8", "faces": "<u4", "normals": "<f8"}
+
+def aligned(size):
+	return (size + ALIGN - 1) // ALIGN * ALIGN
+
+def write_session(converter, path):
+	nodes = []
+	arrays = []
+	position = 0
+	numbers = {}
+
+	for vobject, parent, depth in pre_order(converter.vobjects):
+		numbers[id(vobject)] = len(nodes)
+		level = vobject.model_item.item_data[1] if vobject.model_item != None else converter.tess_overrides.get(vobject.name, -1)
+		node = {
+			"name": vobject.name,
+			"label": converter.node_name(vobject),
+			"level": level,
+			"parent": numbers[id(parent)] if parent != None else -1,
+			"position": [vobject.position.x, vobject.position.y, vobject.position.z],
+			"arrays": {},
+		}
+
+		data = {
+			"global_verts": [(v.x, v.y, v.z) for v in vobject.global_verts],
+			"faces": vobject.faces,
+			"normals": [(n.x, n.y, n.z) for n in vobject.normals],
+		}
+		for key, dtype in ARRAYS.items():
+			array = np.asarray(data[key], dtype=dtype).reshape(-1, 3)
+			node["arrays"][key] = [position, len(array)]
+			arrays.append((position, array))
+			position = aligned(position + array.nbytes)
+
+		nodes.append(node)
+
+	header = json.dumps({
+		"version": 1,
+		"in_file": converter.in_file,
+		"settings": {
+			"method": converter.method,
+			"tess_amt": converter.tess_amt,
+			"linear_deflection": converter.linear_deflection,
+			"angular_deflection": converter.angular_deflection,
+			"center_pivot": converter.center_pivot,
+		},
+		"nodes": nodes,
+	}).encode()
+	data_start = aligned(len(MAGIC) + 8 + len(header))
+
+	with open(path, "wb") as f:
+		f.write(MAGIC)
+		f.write(struct.pack("<Q", len(header)))
+		f.write(header)
+		for offset, array in arrays:
+			f.seek(data_start + offset)
+			f.write(array.tobytes())
+		# trailing parts without geometry still need their offsets inside the file
+		f.truncate(data_start + position)
+
+# Open session file, mesh arrays are only read from the mapping when a part's data is first used
+class Session:
+	def __init__(self, path):
+		self.path = path
+		self.file = open(path, "rb")
+		self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+		if self.map[:len(MAGIC)] != MAGIC:
+			self.close()
+			raise ValueError(f"{path} is not a VATHSA session file")
+
+		header_length = struct.unpack_from("<Q", self.map, len(MAGIC))[0]
+		header_start = len(MAGIC) + 8
+		self.header = json.loads(self.map[header_start:header_start + header_length].decode())
+		self.data_start = aligned(header_start + header_length)
+
+	def array(self, node, key):
+		offset, count = node["arrays"][key]
+		if count == 0:
+			return np.empty((0, 3), dtype=ARRAYS[key])
+		return np.ndarray((count, 3), dtype=ARRAYS[key], buffer=self.map, offset=self.data_start + offset)
+
+	def load_vobjects(self):
+		roots = []
+		vobjects = []
+		for node in self.header["nodes"]:
+			vobject = SessionVobject(self, node)
+			vobjects.append(vobject)
+			if node["parent"] == -1:
+				roots.append(vobject)
+			else:
+				vobjects[node["parent"]].children.append(vobject)
+		return roots
+
+	def close(self):
+		self.map.close()
+		self.file.close()
+
+def lazy_mesh(key):
+	def get(self):
+		if key not in self.__dict__:
+			self.__dict__[key] = self.read_mesh(key)
+		return self.__dict__[key]
+
+	def set(self, value):
+		self.__dict__[key] = value
+
+	return property(get, set)
+
+# Vobject whose mesh lists are built from the session file on first access
+class SessionVobject(Vobject):
+	global_verts = lazy_mesh("global_verts")
+	vertices = lazy_mesh("vertices")
+	faces = lazy_mesh("faces")
+	normals = lazy_mesh("normals")
+
+	def __init__(self, session, node):
+		super().__init__(name=node["name"], position=node["position"])
+		self.session = session
+		self.node = node
+		self.label = node["label"]
+		self.level = node["level"]
+
+		# drop the empty lists Vobject set up so the first read goes to the file
+		for key in ["global_verts", "vertices", "faces", "normals"]:
+			del self.__dict__[key]
+
+	def read_mesh(self, key):
+		import FreeCAD
+
+		if key == "vertices":
+			return [v.sub(self.position) for v in self.global_verts]
+		if key == "faces":
+			return self.session.array(self.node, "faces").tolist()
+		return [FreeCAD.Vector(*row) for row in self.session.array(self.node, key).tolist()]
@@ -0,0 +1,158 @@
+# Fast product structure scan of STEP (ISO 10303-21) files
+# Reads only the PRODUCT / NEXT_ASSEMBLY_USAGE_OCCURRENCE entities and the assembly placements,
+# so the tree can be shown long before FreeCAD has built any B-rep geometry.
+# Placements are reduced to translations, which is all a Vobject keeps.
+
+import re
+
+from Vobject import Vobject
+
+ENTITY = re.compile(r"#(\d+)\s*=\s*(\(?)\s*([A-Z_0-9]*)")
+TOKEN = re.compile(r"'(?:[^']|'')*'|#\d+|\.[A-Z_0-9]+\.|[-+]?\d+\.?\d*(?:[Ee][-+]?\d+)?|[$*(),]|[A-Z_][A-Z_0-9]*")
+
+STRUCTURE = {
+	"PRODUCT",
+	"PRODUCT_DEFINITION_FORMATION",
+	"PRODUCT_DEFINITION_FORMATION_WITH_SPECIFIED_SOURCE",
+	"PRODUCT_DEFINITION",
+	"PRODUCT_DEFINITION_SHAPE",
+	"NEXT_ASSEMBLY_USAGE_OCCURRENCE",
+	"CONTEXT_DEPENDENT_SHAPE_REPRESENTATION",
+	"ITEM_DEFINED_TRANSFORMATION",
+}
+
+def statements(path):
+	# yields (id, type, text) for every entity instance, complex entities have the type "" and keep their full text
+	with open(path, "r", errors="replace") as f:
+		parts = []
+		for line in f:
+			line = line.strip()
+			if not line:
+				continue
+			parts.append(line)
+			if not line.endswith(";"):
+				continue
+			text = " ".join(parts) if len(parts) > 1 else parts[0]
+			parts = []
+
+			match = ENTITY.match(text)
+			if match == None:
+				continue
+			if match.group(2):
+				yield int(match.group(1)), "", text
+			else:
+				yield int(match.group(1)), match.group(3), text[match.end():]
+
+def parse_arguments(text):
+	# nested python lists of '#n' references, strings, numbers and None
+	stack = [[]]
+	for token in TOKEN.findall(text):
+		if token == "(":
+			stack.append([])
+		elif token == ")":
+			if len(stack) == 1:
+				break
+			inner = stack.pop()
+			stack[-1].append(inner)
+		elif token in (",", "$", "*"):
+			if token != ",":
+				stack[-1].append(None)
+		elif token[0] == "'":
+			stack[-1].append(token[1:-1].replace("''", "'"))
+		elif token[0] == "#":
+			stack[-1].append(token)
+		elif token[0] in "-+0123456789":
+			stack[-1].append(float(token))
+		else:
+			stack[-1].append(token)
+	return stack[0][0] if stack[0] and isinstance(stack[0][0], list) else stack[0]
+
+def ref(value):
+	return int(value[1:])
+
+def scan_step(path):
+	entities = {}
+	transformations = {}
+	axes = {}
+
+	# pass 1: product structure, plus the raw text of every axis placement since they may be defined after their use
+	for number, kind, text in statements(path):
+		if kind in STRUCTURE:
+			entities[number] = (kind, parse_arguments(text))
+		elif kind == "AXIS2_PLACEMENT_3D":
+			axes[number] = text
+		elif kind == "" and "REPRESENTATION_RELATIONSHIP_WITH_TRANSFORMATION" in text:
+			found = re.search(r"REPRESENTATION_RELATIONSHIP_WITH_TRANSFORMATION\s*\(\s*#(\d+)", text)
+			if found:
+				transformations[number] = int(found.group(1))
+
+	products = {number: args for number, (kind, args) in entities.items() if kind == "PRODUCT"}
+	definitions = {number: args for number, (kind, args) in entities.items() if kind == "PRODUCT_DEFINITION"}
+	if not definitions:
+		return []
+
+	def product_name(definition):
+		formation = entities.get(ref(definitions[definition][2]))
+		if formation == None:
+			return f"product_{definition}"
+		product = products.get(ref(formation[1][2]), [])
+		name = product[1] if len(product) > 1 and product[1] else (product[0] if product else f"product_{definition}")
+		return name.replace(" ", "_")
+
+	# occurrence number -> item defined transformation number
+	occurrence_transforms = {}
+	for number, (kind, args) in entities.items():
+		if kind == "CONTEXT_DEPENDENT_SHAPE_REPRESENTATION":
+			shape = entities.get(ref(args[1]))
+			relationship = ref(args[0])
+			if shape != None and relationship in transformations:
+				occurrence_transforms[ref(shape[1][2])] = transformations[relationship]
+
+	# pass 2: only the points the used placements refer to
+	needed_axes = {}
+	for occurrence, transform in occurrence_transforms.items():
+		kind, args = entities.get(transform, ("", []))
+		if kind == "ITEM_DEFINED_TRANSFORMATION":
+			for axis in (ref(args[2]), ref(args[3])):
+				if axis in axes:
+					needed_axes[axis] = ref(parse_arguments(axes[axis])[1])
+	points = {}
+	if needed_axes:
+		wanted = set(needed_axes.values())
+		for number, kind, text in statements(path):
+			if kind == "CARTESIAN_POINT" and number in wanted:
+				points[number] = parse_arguments(text)[1]
+
+	def translation(occurrence):
+		kind, args = entities.get(occurrence_transforms.get(occurrence), ("", []))
+		if kind != "ITEM_DEFINED_TRANSFORMATION":
+			return (0.0, 0.0, 0.0)
+		origin = points.get(needed_axes.get(ref(args[2])), [0.0, 0.0, 0.0])
+		placed = points.get(needed_axes.get(ref(args[3])), [0.0, 0.0, 0.0])
+		return tuple(placed[i] - origin[i] for i in range(3))
+
+	# assembly edges, parent definition -> [(occurrence, child definition)]
+	children = {}
+	used = set()
+	for number, (kind, args) in sorted(entities.items()):
+		if kind == "NEXT_ASSEMBLY_USAGE_OCCURRENCE":
+			children.setdefault(ref(args[3]), []).append((number, ref(args[4])))
+			used.add(ref(args[4]))
+
+	roots = []
+	stack = []
+	for definition in sorted(definitions):
+		if definition not in used:
+			vobject = Vobject(name=product_name(definition))
+			roots.append(vobject)
+			stack.append((definition, vobject))
+
+	# expand every occurrence, a product used twice appears twice like in FreeCAD
+	while stack:
+		definition, vobject = stack.pop()
+		for occurrence, child in children.get(definition, []):
+			child_vobject = Vobject(name=product_name(child), position=translation(occurrence))
+			vobject.children.append(child_vobject)
+			stack.append((child, child_vobject))
+
+	return roots
@@ -0,0 +1,33 @@
+# Iterative tree walks with explicit stacks, deep supplier assemblies overflow python's recursion limit
+# Every walk yields (node, parent, depth); parent is the given parent for the roots.
+
+def vobject_children(vobject):
+	return vobject.children
+
+def part_children(part):
+	# FreeCAD document objects, only App::Part containers are descended into
+	if part.TypeId == "App::Part":
+		return part.Group
+	return []
+
+def pre_order(roots, children=vobject_children, parent=None, descend=None):
+	# descend(node, depth) returning False skips that node's subtree
+	stack = [(node, parent, 0) for node in reversed(roots)]
+	while stack:
+		node, node_parent, depth = stack.pop()
+		yield node, node_parent, depth
+		if descend != None and not descend(node, depth):
+			continue
+		for child in reversed(children(node)):
+			stack.append((child, node, depth + 1))
+
+def post_order(roots, children=vobject_children, parent=None):
+	stack = [(node, parent, 0, False) for node in reversed(roots)]
+	while stack:
+		node, node_parent, depth, expanded = stack.pop()
+		if expanded:
+			yield node, node_parent, depth
+			continue
+		stack.append((node, node_parent, depth, True))
+		for child in reversed(children(node)):
+			stack.append((child, node, depth + 1, False))
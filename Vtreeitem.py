@@ -1,17 +1,25 @@
 import sys
 from PySide2 import QtGui, QtCore
 from Vobject import Vobject
+from Vtraverse import pre_order
 
 class VTreeItem:
 	def __init__(self, parent: 'VTreeItem' = None, obj = None, data = []):
 		self.item_data = data
 		self.parent_item = parent
 		self.child_items = []
+		self.vobject = obj
 		if obj != None:
 			self.item_data = [obj.name, -1]
 			obj.model_item = self
-			for child in obj.children:
-				self.child_items.append(VTreeItem(self, child))
+
+			# build the whole subtree without recursing
+			for child, parent, depth in pre_order(obj.children, parent=obj):
+				parent_item = parent.model_item
+				item = VTreeItem(parent_item, data=[child.name, -1])
+				item.vobject = child
+				child.model_item = item
+				parent_item.child_items.append(item)
 
 	def child(self, number: int) -> 'VTreeItem':
 		if number < 0 or number >= len(self.child_items):
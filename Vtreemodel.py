@@ -1,6 +1,7 @@
 from PySide2.QtCore import QModelIndex, Qt, QAbstractItemModel
 from Vtreeitem import VTreeItem
 from Vobject import Vobject
+from Vnameindex import NameIndex
 
 
 class VTreeModel(QAbstractItemModel):
@@ -10,6 +11,7 @@ class VTreeModel(QAbstractItemModel):
 
 		self.root_data = headers
 		self.root_item = VTreeItem(data=self.root_data.copy())
+		self.name_index = None
 		# self.setup_model_data(data.split("\n"), self.root_item)
 
 	def columnCount(self, parent: QModelIndex = None) -> int:
@@ -136,6 +138,9 @@ class VTreeModel(QAbstractItemModel):
 		result: bool = item.set_data(index.column(), value)
 
 		if result:
+			if index.column() == 0:
+				# renamed, rebuild the search index on the next search
+				self.name_index = None
 			self.dataChanged.emit(index, index, [Qt.DisplayRole, Qt.EditRole])
 
 		return result
@@ -188,7 +193,28 @@ class VTreeModel(QAbstractItemModel):
 
 	def setup_model_data2(self, vobj):
 		self.removeRows(0, self.rowCount())
-		self.root_item.child_items.append(VTreeItem(obj=vobj))
+		self.root_item.child_items.append(VTreeItem(self.root_item, obj=vobj))
+		self.name_index = NameIndex(self.root_item)
+
+	def get_name_index(self) -> NameIndex:
+		if self.name_index == None:
+			self.name_index = NameIndex(self.root_item)
+		return self.name_index
+
+	def search(self, text: str, limit: int = None) -> list:
+		return self.get_name_index().search(text, limit)
+
+	def item_path(self, item: VTreeItem) -> str:
+		return self.get_name_index().path(item)
+
+	def index_for_item(self, item: VTreeItem, column: int = 0) -> QModelIndex:
+		return self.createIndex(self.get_name_index().row(item), column, item)
+
+	def set_tess_level(self, items: list, value) -> None:
+		for item in items:
+			item.set_data(1, value)
+			index = self.index_for_item(item, 1)
+			self.dataChanged.emit(index, index, [Qt.DisplayRole, Qt.EditRole])
 
 
 	def _repr_recursion(self, item: VTreeItem, indent: int = 0) -> str:
@@ -0,0 +1,65 @@
+# Bulk mesh checks run on every tessellated part before export
+# Works on whole numpy arrays per part so it can stay on for multi-million triangle models.
+
+import numpy as np
+
+REPORT_KEYS = ["out_of_range", "degenerate", "duplicate", "unreferenced"]
+
+def validate_mesh(vobject, min_area=1e-12):
+	report = dict.fromkeys(REPORT_KEYS, 0)
+	vertex_count = len(vobject.vertices)
+
+	if not vobject.faces:
+		report["unreferenced"] = vertex_count
+		vobject.vertices = []
+		vobject.global_verts = []
+		return report
+
+	if vertex_count == 0:
+		# every face points outside an empty vertex list
+		report["out_of_range"] = len(vobject.faces)
+		vobject.faces = []
+		vobject.normals = []
+		return report
+
+	verts = np.array([(v.x, v.y, v.z) for v in vobject.vertices], dtype=np.float64).reshape(-1, 3)
+	faces = np.array(vobject.faces, dtype=np.int64).reshape(-1, 3)
+
+	# indices that point outside this part's vertex list
+	keep = np.all((faces >= 0) & (faces < vertex_count), axis=1)
+	report["out_of_range"] = int(np.count_nonzero(~keep))
+
+	# zero area triangles, the cross product length is twice the area
+	tri = verts[np.where(keep[:, None], faces, 0)]
+	doubled_area = np.linalg.norm(np.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0]), axis=1)
+	degenerate = keep & (doubled_area <= 2 * min_area)
+	report["degenerate"] = int(np.count_nonzero(degenerate))
+	keep &= ~degenerate
+
+	# duplicates share a vertex set regardless of winding, the first one is kept
+	kept = np.flatnonzero(keep)
+	rows = np.sort(faces[kept], axis=1)
+	order = np.lexsort((rows[:, 2], rows[:, 1], rows[:, 0]))
+	duplicate = np.zeros(len(kept), dtype=bool)
+	duplicate[order[1:]] = np.all(rows[order[1:]] == rows[order[:-1]], axis=1)
+	report["duplicate"] = int(np.count_nonzero(duplicate))
+	kept = kept[~duplicate]
+
+	# compact vertices no remaining face refers to
+	used = np.zeros(vertex_count, dtype=bool)
+	used[faces[kept].ravel()] = True
+	report["unreferenced"] = vertex_count - int(np.count_nonzero(used))
+
+	if len(kept) == len(vobject.faces) and report["unreferenced"] == 0:
+		return report
+
+	remap = np.cumsum(used) - 1
+	used_indices = np.flatnonzero(used).tolist()
+
+	if len(vobject.normals) == len(vobject.faces):
+		vobject.normals = [vobject.normals[i] for i in kept.tolist()]
+	vobject.faces = remap[faces[kept]].tolist()
+	vobject.vertices = [vobject.vertices[i] for i in used_indices]
+	vobject.global_verts = [vobject.global_verts[i] for i in used_indices]
+
+	return report
@@ -0,0 +1,3 @@
+ECHO OFF
+"D:\\edmond3\\VIPR3.6\\FreeCAD 0.21\\bin\\python.exe" ".\\Vserver.py" serve %*
+pause
\ No newline at end of file